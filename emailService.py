@@ -1,26 +1,182 @@
-from email.mime.application import MIMEApplication
+from asyncio import to_thread
+from base64 import encodebytes
+from concurrent.futures import ThreadPoolExecutor
+from errno import EBADF
+from errno import ELOOP
+from errno import ENOENT
+from errno import ENOTDIR
+from email.mime.base import MIMEBase
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from gzip import GzipFile
+from io import BytesIO
+from io import StringIO
 from pathlib import Path
+from shutil import copyfileobj
 from smtplib import SMTP
 from smtplib import SMTPException
+from smtplib import SMTPServerDisconnected
 from ssl import create_default_context
+from stat import S_ISREG
+from threading import Lock
 from threading import Thread
+from time import monotonic
 from typing import Optional
 
+# A multiple of 57 bytes so every chunk encodes to whole 76 character lines.
+_BASE64_CHUNK_SIZE = 57 * 1024
+
+# Loading the system CA bundle is expensive, so build the context only once.
+_SSL_CONTEXT = create_default_context()
+
+_MAX_ATTACHMENT_READERS = 8
+
+# Text formats that shrink well; already compressed formats are sent as is.
+_COMPRESSIBLE_SUFFIXES = frozenset({".csv", ".json", ".log", ".txt", ".xml"})
+
+_MISSING_FILE_ERRNOS = frozenset({ENOENT, ENOTDIR, EBADF, ELOOP})
+
+
+class AttachmentSizeExceeded(Exception):
+    size: int
+    limit: int
+
+    def __init__(self, filepath: Path, size: int, limit: int) -> None:
+        super().__init__(f"{filepath} is {size} bytes, the limit is {limit} bytes")
+        self.size = size
+        self.limit = limit
+
+
+def _open_connection(server: str, port: int, username: str, password: str) -> SMTP:
+    connection = SMTP(server, port)
+    try:
+        connection.starttls(context=_SSL_CONTEXT)
+        connection.login(username, password)
+    except Exception:
+        connection.close()
+        raise
+
+    return connection
+
+
+class SMTPConnectionPool:
+    """
+    Keeps logged-in SMTP connections around so that consecutive sends to the
+    same server skip the TLS handshake and login. A connection is closed once
+    it has been idle for more than max_idle seconds or has sent max_messages.
+    """
+
+    max_idle: float
+    max_messages: int
+
+    _idle: dict[tuple[str, int, str], tuple[SMTP, float, int]]
+    _in_use: dict[SMTP, tuple[tuple[str, int, str], int]]
+    _closing: set[SMTP]
+
+    def __init__(self, max_idle: float = 100.0, max_messages: int = 100) -> None:
+        self.max_idle = max_idle
+        self.max_messages = max_messages
+
+        self._idle = {}
+        self._in_use = {}
+        self._closing = set()
+        self._lock = Lock()
+
+    def acquire(self, server: str, port: int, username: str, password: str) -> SMTP:
+        key = (server, port, username)
+
+        with self._lock:
+            cached = self._idle.pop(key, None)
+
+        if cached is not None:
+            connection, last_used, msg_count = cached
+            if monotonic() - last_used <= self.max_idle and msg_count < self.max_messages:
+                with self._lock:
+                    self._in_use[connection] = (key, msg_count)
+                return connection
+
+            self._quit(connection)
+
+        connection = _open_connection(server, port, username, password)
+        with self._lock:
+            self._in_use[connection] = (key, 0)
+        return connection
+
+    def release(self, connection: SMTP) -> None:
+        with self._lock:
+            key, msg_count = self._in_use.pop(connection)
+            msg_count += 1
+            if (
+                msg_count >= self.max_messages
+                or key in self._idle
+                or connection in self._closing
+            ):
+                self._closing.discard(connection)
+                stale = connection
+            else:
+                self._idle[key] = (connection, monotonic(), msg_count)
+                stale = None
+
+        if stale is not None:
+            self._quit(stale)
+
+    def discard(self, connection: SMTP) -> None:
+        with self._lock:
+            self._in_use.pop(connection, None)
+            self._closing.discard(connection)
+
+        self._quit(connection)
+
+    def close(self) -> None:
+        """
+        Closes the idle connections. Connections that are in the middle of a
+        send are closed as soon as they are released or discarded.
+        """
+
+        with self._lock:
+            connections = [connection for connection, _, _ in self._idle.values()]
+            self._idle.clear()
+            self._closing.update(self._in_use)
+
+        for connection in connections:
+            self._quit(connection)
+
+    @staticmethod
+    def _quit(connection: SMTP) -> None:
+        try:
+            connection.quit()
+        except (SMTPException, OSError):
+            connection.close()
+
 
 class EmailServiceSettings:
     username: str
     password: str
     server: str
     port: int
+    connection_pool: Optional[SMTPConnectionPool]
+    max_attachment_bytes: Optional[int]
+    compress_attachments: bool
 
-    def __init__(self, username: str, password: str, server: str, port: int, dev_mode: bool = False) -> None:
+    def __init__(
+        self,
+        username: str,
+        password: str,
+        server: str,
+        port: int,
+        dev_mode: bool = False,
+        connection_pool: Optional[SMTPConnectionPool] = None,
+        max_attachment_bytes: Optional[int] = None,
+        compress_attachments: bool = False,
+    ) -> None:
         self.dev_mode = dev_mode
         self.username = username
         self.password = password
         self.server = server
         self.port = port
+        self.connection_pool = connection_pool
+        self.max_attachment_bytes = max_attachment_bytes
+        self.compress_attachments = compress_attachments
 
 
 class EmailService:
@@ -29,6 +185,9 @@ class EmailService:
     password: str
     server: str
     port: int
+    connection_pool: Optional[SMTPConnectionPool]
+    max_attachment_bytes: Optional[int]
+    compress_attachments: bool
 
     _subject: str
     _msg: Optional[MIMEMultipart]
@@ -39,7 +198,8 @@ class EmailService:
     _recipients: set[str]
     _cc_recipients: set[str]
     _bcc_recipients: set[str]
-    _attachments: set[tuple[Path, str]]
+    _all_recipients_cache: Optional[tuple[str, ...]]
+    _attachments: dict[Path, str]
 
     def __init__(self, settings: EmailServiceSettings) -> None:
         self.dev_mode = settings.dev_mode
@@ -47,9 +207,12 @@ class EmailService:
         self.password = settings.password
         self.server = settings.server
         self.port = settings.port
+        self.connection_pool = settings.connection_pool
+        self.max_attachment_bytes = settings.max_attachment_bytes
+        self.compress_attachments = settings.compress_attachments
 
         self._subject = ""
-        self._msg_body = MIMEText("")
+        self._msg_body = None
         self._original_msg_body = MIMEText("")
         self._original_sender = settings.username
         self._reply_to = settings.username
@@ -57,18 +220,23 @@ class EmailService:
         self._recipients = set()
         self._cc_recipients = set()
         self._bcc_recipients = set()
-        self._attachments = set()
+        self._all_recipients_cache = None
+        self._attachments = {}
 
-        self._msg = MIMEMultipart()
-        self._msg.set_type("multipart/alternative")
+        self._msg = self._build_message()
 
     def __repr__(self) -> str:
+        # Show the last built message rather than building one, so repr()
+        # never reads attachments from disk.
+        return self._describe(self._msg)
+
+    def _describe(self, msg: MIMEMultipart) -> str:
         attachments = "\n".join(
-            [f"{file} - {status}" for file, status in self._attachments]
+            [f"{file} - {status}" for file, status in self._attachments.items()]
         )
         return (
             f"<Class: EmailService>"
-            f"\n{self._msg}\n"
+            f"\n{msg}\n"
             "Files set for attachment:\n"
             f"{attachments}"
         )
@@ -88,11 +256,10 @@ class EmailService:
         self._msg_body = MIMEText(body)
         self._msg_body.set_type("text/html")
         self._msg_body.set_param("charset", "UTF-8")
-        self._msg.attach(self._msg_body)
         return self
 
     def reply_to(self, reply_to: str) -> "EmailService":
-        self._msg.replace_header("Reply-To", reply_to)
+        self._reply_to = reply_to
         return self
 
     def from_(self, from_: str) -> "EmailService":
@@ -101,57 +268,152 @@ class EmailService:
 
     def recipients(self, recipients: list[str]) -> "EmailService":
         self._recipients.update(set(recipients))
-        if "To" in self._msg:
-            self._msg.replace_header("To", ", ".join(self._recipients))
-            return self
-
-        self._msg.add_header("To", ", ".join(self._recipients))
+        self._all_recipients_cache = None
         return self
 
     def cc_recipients(self, cc_recipients: list[str]) -> "EmailService":
         self._cc_recipients.update(set(cc_recipients))
-        if "CC" in self._msg:
-            self._msg.replace_header("CC", ", ".join(self._cc_recipients))
-            return self
-
-        self._msg.add_header("CC", ", ".join(self._cc_recipients))
+        self._all_recipients_cache = None
         return self
 
     def bcc_recipients(self, bcc_recipients: list[str]) -> "EmailService":
         self._bcc_recipients.update(set(bcc_recipients))
-        if "BCC" in self._msg:
-            self._msg.replace_header("BCC", ", ".join(self._bcc_recipients))
-            return self
-
-        self._msg.add_header("BCC", ", ".join(self._bcc_recipients))
+        self._all_recipients_cache = None
         return self
 
-    def attach_files(self, files: list[str | Path]) -> "EmailService":
-        for file in files:
-            if isinstance(file, Path):
-                filepath: Path = file
-            else:
-                filepath: Path = Path(file)
-
-            self._attachments.update(
-                [(filepath, "Exists" if filepath.exists() else "Missing")]
+    @property
+    def _all_recipients(self) -> tuple[str, ...]:
+        if self._all_recipients_cache is None:
+            self._all_recipients_cache = tuple(
+                sorted(self._recipients | self._cc_recipients | self._bcc_recipients)
             )
 
-            if filepath.exists():
-                contents = MIMEApplication(
-                    filepath.read_bytes(), _subtype=filepath.suffix
-                )
-                contents.add_header(
-                    "Content-Disposition", "attachment", filename=filepath.name
+        return self._all_recipients_cache
+
+    def attach_files(self, files: list[str | Path]) -> "EmailService":
+        statuses: dict[Path, str] = {}
+        for file in files:
+            filepath = Path(file)
+            try:
+                stat = filepath.stat()
+            except OSError as error:
+                # Same errors pathlib's is_file() treats as "does not exist".
+                if error.errno not in _MISSING_FILE_ERRNOS:
+                    raise
+                stat = None
+
+            exists = stat is not None and S_ISREG(stat.st_mode)
+            if (
+                exists
+                and self.max_attachment_bytes is not None
+                and stat.st_size > self.max_attachment_bytes
+            ):
+                raise AttachmentSizeExceeded(
+                    filepath, stat.st_size, self.max_attachment_bytes
                 )
-                self._msg.attach(contents)
 
+            statuses[filepath] = "Exists" if exists else "Missing"
+
+        # Only record the files once all of them have passed the size check.
+        self._attachments.update(statuses)
         return self
 
     def attach_file(self, file: str | Path) -> "EmailService":
         self.attach_files([file])
         return self
 
+    def _build_message(self) -> MIMEMultipart:
+        # The message is assembled in one pass from the builder state, so
+        # attachments are only read and encoded when it is actually needed.
+        msg = MIMEMultipart()
+        msg.set_type("multipart/alternative")
+
+        msg.add_header("Original-Sender", self._original_sender)
+        msg.add_header("Reply-To", self._reply_to)
+        msg.add_header("From", self._from)
+        msg.add_header("Subject", self._subject)
+
+        if self._recipients:
+            msg.add_header("To", ", ".join(sorted(self._recipients)))
+        if self._cc_recipients:
+            msg.add_header("CC", ", ".join(sorted(self._cc_recipients)))
+        if self._bcc_recipients:
+            msg.add_header("BCC", ", ".join(sorted(self._bcc_recipients)))
+
+        if self._msg_body is not None:
+            msg.attach(self._msg_body)
+
+        filepaths = [
+            filepath
+            for filepath, status in self._attachments.items()
+            if status == "Exists"
+        ]
+
+        compress_flags = [
+            self.compress_attachments
+            and filepath.suffix.lower() in _COMPRESSIBLE_SUFFIXES
+            for filepath in filepaths
+        ]
+
+        # Reading the files is the slow part on remote filesystems, so do it
+        # concurrently and only build the MIME parts back on this thread.
+        if len(filepaths) > 1:
+            with ThreadPoolExecutor(
+                max_workers=min(_MAX_ATTACHMENT_READERS, len(filepaths))
+            ) as executor:
+                payloads = list(executor.map(self._read_attachment, filepaths, compress_flags))
+        else:
+            payloads = [
+                self._read_attachment(filepath, compress)
+                for filepath, compress in zip(filepaths, compress_flags)
+            ]
+
+        for filepath, compress, payload in zip(filepaths, compress_flags, payloads):
+            if payload is None:
+                # The file was deleted after it was attached.
+                self._attachments[filepath] = "Missing"
+                continue
+
+            if compress:
+                contents = MIMEBase("application", "gzip")
+                filename = f"{filepath.name}.gz"
+            else:
+                contents = MIMEBase("application", filepath.suffix)
+                filename = filepath.name
+
+            contents.set_payload(payload)
+            contents.add_header("Content-Transfer-Encoding", "base64")
+            contents.add_header("Content-Disposition", "attachment", filename=filename)
+            msg.attach(contents)
+
+        return msg
+
+    @classmethod
+    def _read_attachment(cls, filepath: Path, compress: bool) -> Optional[str]:
+        try:
+            return cls._encode_file(filepath, compress)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _encode_file(filepath: Path, compress: bool = False) -> str:
+        if compress:
+            buffer = BytesIO()
+            with filepath.open("rb") as file:
+                with GzipFile(fileobj=buffer, mode="wb") as gzip_file:
+                    copyfileobj(file, gzip_file, _BASE64_CHUNK_SIZE)
+
+            return encodebytes(buffer.getvalue()).decode("ascii")
+
+        # Encode the file chunk by chunk rather than reading it whole, so only
+        # the base64 text is ever held in memory.
+        payload = StringIO()
+        with filepath.open("rb") as file:
+            while chunk := file.read(_BASE64_CHUNK_SIZE):
+                payload.write(encodebytes(chunk).decode("ascii"))
+
+        return payload.getvalue()
+
     def send(self, debug: bool = False) -> bool:
         """
         Sends the email. If debug is True, it will print the email.
@@ -159,15 +421,12 @@ class EmailService:
         :return:
         """
 
-        self._msg.add_header("Original-Sender", self._original_sender)
-        self._msg.add_header("Reply-To", self._reply_to)
-        self._msg.add_header("From", self._from)
-        self._msg.add_header("Subject", self._subject)
+        self._msg = self._build_message()
 
         if self.dev_mode:
             print()
             print("printing email:")
-            print(self)
+            print(self._describe(self._msg))
             print()
             print("Original message:")
             print(self._original_msg_body)
@@ -175,14 +434,13 @@ class EmailService:
             return True
 
         try:
-            with SMTP(self.server, self.port) as connection:
-                connection.starttls(context=create_default_context())
-                connection.login(self.username, self.password)
-                connection.sendmail(
-                    self.username,
-                    [*self._recipients, *self._cc_recipients, *self._bcc_recipients],
-                    self._msg.as_string(),
-                )
+            if self.connection_pool is None:
+                with _open_connection(
+                    self.server, self.port, self.username, self.password
+                ) as connection:
+                    self._sendmail(connection)
+            else:
+                self._send_pooled(self.connection_pool)
         except SMTPException as error:
             if debug:
                 print(error)
@@ -192,7 +450,7 @@ class EmailService:
         if debug:
             print()
             print("printing email after sending:")
-            print(self)
+            print(self._describe(self._msg))
             print()
             print("Original message:")
             print(self._original_msg_body)
@@ -200,6 +458,46 @@ class EmailService:
 
         return True
 
+    async def send_async(self, debug: bool = False) -> bool:
+        """
+        Sends the email without blocking the event loop, so several emails
+        can be sent concurrently with asyncio.gather.
+        :param debug:
+        :return:
+        """
+
+        return await to_thread(self.send, debug)
+
+    def _sendmail(self, connection: SMTP) -> None:
+        # send_message strips the BCC header, so blind copies stay hidden from
+        # other recipients, and flattens to bytes without an extra str copy.
+        connection.send_message(
+            self._msg,
+            from_addr=self.username,
+            to_addrs=self._all_recipients,
+        )
+
+    def _send_pooled(self, pool: SMTPConnectionPool) -> None:
+        # A cached connection may have been dropped by the server while idle,
+        # so retry once on a fresh one before giving up.
+        for attempt in range(2):
+            connection = pool.acquire(self.server, self.port, self.username, self.password)
+            try:
+                self._sendmail(connection)
+            except SMTPServerDisconnected:
+                pool.discard(connection)
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                # Socket errors and interrupts leave the connection in an
+                # unknown state, so it must not go back into the pool.
+                pool.discard(connection)
+                raise
+
+            pool.release(connection)
+            return
+
 
 # usage:
 """
@@ -1,9 +1,20 @@
+import asyncio
+import gzip
 import unittest
+from email.mime.application import MIMEApplication
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
 from pathlib import Path
+from smtplib import SMTP, SMTPServerDisconnected
+from tempfile import TemporaryDirectory
+from unittest.mock import Mock, patch
 
-from emailService import EmailService, EmailServiceSettings
+from emailService import (
+    AttachmentSizeExceeded,
+    EmailService,
+    EmailServiceSettings,
+    SMTPConnectionPool,
+)
 
 
 class TestEmailService(unittest.TestCase):
@@ -47,17 +58,35 @@ class TestEmailService(unittest.TestCase):
         self.assertIsInstance(email_service._msg_body, MIMEText)
         self.assertEqual(email_service._msg_body.get_payload(), "Test Body")
 
-    # def test_reply_to(self):
-    #     settings = EmailServiceSettings(
-    #         username="test@test.com",
-    #         password="password",
-    #         server="smtp.test.com",
-    #         port=587,
-    #     )
-    #     email_service = EmailService(settings)
-    #     email_service.reply_to("reply@test.com")
+    def test_reply_to(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+        email_service.reply_to("reply@test.com")
+
+        self.assertEqual(email_service._reply_to, "reply@test.com")
 
-    #     self.assertEqual(email_service._reply_to, "reply@test.com")
+    def test_all_recipients(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+        email_service.recipients(["b@test.com"]).cc_recipients(["a@test.com", "b@test.com"])
+
+        self.assertEqual(email_service._all_recipients, ("a@test.com", "b@test.com"))
+
+        email_service.bcc_recipients(["c@test.com"])
+
+        self.assertEqual(
+            email_service._all_recipients, ("a@test.com", "b@test.com", "c@test.com")
+        )
 
     def test_attach_file(self) -> None:
         settings = EmailServiceSettings(
@@ -71,6 +100,279 @@ class TestEmailService(unittest.TestCase):
 
         self.assertEqual(len(email_service._attachments), 1)
 
+    def test_attach_file_twice_updates_status(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            email_service.attach_file(filepath)
+            filepath.write_text("test")
+            email_service.attach_file(filepath)
+
+        self.assertEqual(email_service._attachments, {filepath: "Exists"})
+
+    def test_attach_file_deleted_before_send(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            dev_mode=True,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            filepath.write_text("test")
+            email_service.attach_file(filepath)
+
+        with patch("builtins.print"):
+            self.assertTrue(email_service.send())
+
+        self.assertEqual(email_service._attachments, {filepath: "Missing"})
+        self.assertEqual(len(email_service._msg.get_payload()), 0)
+
+    def test_send_email_unreadable_attachment_raises(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            dev_mode=True,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            filepath.write_text("test")
+            email_service.attach_file(filepath)
+
+            with patch.object(
+                EmailService, "_encode_file", side_effect=PermissionError()
+            ), patch("builtins.print"):
+                with self.assertRaises(PermissionError):
+                    email_service.send()
+
+        self.assertEqual(email_service._attachments, {filepath: "Exists"})
+
+    def test_repr_does_not_read_attachments(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            filepath.write_text("test")
+            email_service.attach_file(filepath)
+
+            with patch.object(EmailService, "_encode_file") as encode_file:
+                description = repr(email_service)
+
+        encode_file.assert_not_called()
+        self.assertIn(f"{filepath} - Exists", description)
+
+    def test_send_email_builds_message_once(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            dev_mode=True,
+        )
+        email_service = EmailService(settings)
+
+        with patch.object(
+            email_service, "_build_message", wraps=email_service._build_message
+        ) as build_message, patch("builtins.print"):
+            email_service.send(debug=True)
+
+        build_message.assert_called_once()
+
+    def test_attach_file_encodes_like_mime_application(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "large.bin"
+            filepath.write_bytes(bytes(range(256)) * 1000)
+            email_service.attach_file(filepath)
+            expected = MIMEApplication(filepath.read_bytes(), _subtype=filepath.suffix)
+            attachment = email_service._build_message().get_payload()[-1]
+
+        self.assertEqual(attachment["Content-Transfer-Encoding"], "base64")
+        self.assertEqual(attachment.get_payload(), expected.get_payload())
+
+    def test_build_message(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+        email_service.subject("Test Subject").body("Test Body")
+        email_service.recipients(["test1@test.com"]).recipients(["test1@test.com"])
+        email_service.cc_recipients(["test2@test.com"])
+
+        msg = email_service._build_message()
+
+        self.assertEqual(msg["Subject"], "Test Subject")
+        self.assertEqual(msg.get_all("To"), ["test1@test.com"])
+        self.assertEqual(msg["CC"], "test2@test.com")
+        self.assertEqual(len(msg.get_payload()), 1)
+
+    def test_recipients_header_is_sorted(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+        email_service.recipients(["c@test.com", "a@test.com"])
+        email_service.recipients(["b@test.com"])
+
+        msg = email_service._build_message()
+
+        self.assertEqual(msg["To"], "a@test.com, b@test.com, c@test.com")
+
+    def test_attach_files_keeps_order(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepaths = [Path(directory) / f"test{i}.txt" for i in range(10)]
+            for filepath in filepaths:
+                filepath.write_text(filepath.name)
+            email_service.attach_files(filepaths)
+            attachments = email_service._build_message().get_payload()
+
+        self.assertEqual(
+            [attachment.get_filename() for attachment in attachments],
+            [filepath.name for filepath in filepaths],
+        )
+        self.assertEqual(
+            [attachment.get_payload(decode=True) for attachment in attachments],
+            [filepath.name.encode() for filepath in filepaths],
+        )
+
+    def test_attach_file_over_size_limit(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            max_attachment_bytes=10,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            filepath.write_text("more than ten bytes")
+
+            with self.assertRaises(AttachmentSizeExceeded):
+                email_service.attach_file(filepath)
+
+        self.assertEqual(email_service._attachments, {})
+
+    def test_attach_directory_is_missing(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            max_attachment_bytes=10,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            email_service.attach_file(directory)
+
+        self.assertEqual(email_service._attachments, {Path(directory): "Missing"})
+
+    def test_attach_path_under_file_is_missing(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            filepath = Path(directory) / "test.txt"
+            filepath.write_text("test")
+            email_service.attach_file(filepath / "sub")
+
+        self.assertEqual(email_service._attachments, {filepath / "sub": "Missing"})
+
+    def test_attach_files_over_size_limit_records_nothing(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            max_attachment_bytes=10,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            small = Path(directory) / "small.txt"
+            small.write_text("small")
+            large = Path(directory) / "large.txt"
+            large.write_text("more than ten bytes")
+
+            with self.assertRaises(AttachmentSizeExceeded):
+                email_service.attach_files([small, large])
+
+        self.assertEqual(email_service._attachments, {})
+
+    def test_attach_file_compressed(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            compress_attachments=True,
+        )
+        email_service = EmailService(settings)
+
+        with TemporaryDirectory() as directory:
+            text = Path(directory) / "test.csv"
+            text.write_text("a,b,c\n" * 1000)
+            image = Path(directory) / "test.png"
+            image.write_bytes(b"png")
+            email_service.attach_files([text, image])
+            attachments = email_service._build_message().get_payload()
+
+        self.assertEqual(attachments[0].get_content_type(), "application/gzip")
+        self.assertEqual(attachments[0].get_filename(), "test.csv.gz")
+        self.assertEqual(
+            gzip.decompress(attachments[0].get_payload(decode=True)), b"a,b,c\n" * 1000
+        )
+        self.assertEqual(attachments[1].get_filename(), "test.png")
+        self.assertEqual(attachments[1].get_payload(decode=True), b"png")
+
     def test_send_email(self) -> None:
         settings = EmailServiceSettings(
             username="test@test.com",
@@ -87,6 +389,146 @@ class TestEmailService(unittest.TestCase):
 
         self.assertTrue(result)
 
+    @patch("emailService.SMTP")
+    def test_send_email_reuses_pooled_connection(self, smtp) -> None:
+        pool = SMTPConnectionPool()
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            connection_pool=pool,
+        )
+
+        for _ in range(3):
+            email_service = EmailService(settings)
+            email_service.recipients(["test@test.com"])
+            self.assertTrue(email_service.send())
+
+        smtp.assert_called_once_with("smtp.test.com", 587)
+        self.assertEqual(smtp.return_value.send_message.call_count, 3)
+
+    @patch("emailService.SMTP")
+    def test_send_email_reconnects_after_pooled_disconnect(self, smtp) -> None:
+        pool = SMTPConnectionPool()
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            connection_pool=pool,
+        )
+        smtp.return_value.send_message.side_effect = [None, SMTPServerDisconnected(), None]
+
+        for _ in range(2):
+            email_service = EmailService(settings)
+            email_service.recipients(["test@test.com"])
+            self.assertTrue(email_service.send())
+
+        self.assertEqual(smtp.call_count, 2)
+        self.assertEqual(smtp.return_value.send_message.call_count, 3)
+
+    @patch("emailService.SMTP")
+    def test_send_email_discards_pooled_connection_on_socket_error(self, smtp) -> None:
+        pool = SMTPConnectionPool()
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+            connection_pool=pool,
+        )
+        smtp.return_value.send_message.side_effect = TimeoutError()
+        email_service = EmailService(settings)
+        email_service.recipients(["test@test.com"])
+
+        with self.assertRaises(TimeoutError):
+            email_service.send()
+
+        self.assertEqual(pool._in_use, {})
+        self.assertEqual(pool._idle, {})
+        smtp.return_value.quit.assert_called_once()
+
+    @patch("emailService.SMTP")
+    def test_pool_close_closes_in_use_connection_on_release(self, smtp) -> None:
+        pool = SMTPConnectionPool()
+        connection = pool.acquire("smtp.test.com", 587, "test@test.com", "password")
+
+        pool.close()
+        connection.quit.assert_not_called()
+        pool.release(connection)
+
+        connection.quit.assert_called_once()
+        self.assertEqual(pool._idle, {})
+
+    @patch("emailService.monotonic")
+    @patch("emailService.SMTP")
+    def test_pool_evicts_idle_connection(self, smtp, monotonic) -> None:
+        pool = SMTPConnectionPool(max_idle=100)
+        monotonic.return_value = 0.0
+        connection = pool.acquire("smtp.test.com", 587, "test@test.com", "password")
+        pool.release(connection)
+
+        monotonic.return_value = 101.0
+        pool.acquire("smtp.test.com", 587, "test@test.com", "password")
+
+        connection.quit.assert_called_once()
+        self.assertEqual(smtp.call_count, 2)
+
+    @patch("emailService.SMTP")
+    def test_pool_evicts_connection_after_max_messages(self, smtp) -> None:
+        pool = SMTPConnectionPool(max_messages=2)
+
+        for _ in range(2):
+            connection = pool.acquire("smtp.test.com", 587, "test@test.com", "password")
+            pool.release(connection)
+
+        self.assertEqual(smtp.call_count, 1)
+        connection.quit.assert_called_once()
+        self.assertEqual(pool._idle, {})
+
+    def test_send_email_strips_bcc_header(self) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_service = EmailService(settings)
+        email_service.recipients(["test1@test.com"])
+        email_service.bcc_recipients(["test2@test.com"])
+
+        connection = SMTP(local_hostname="localhost")
+        connection.ehlo_or_helo_if_needed = Mock()
+        connection.sendmail = Mock()
+        email_service._msg = email_service._build_message()
+        email_service._sendmail(connection)
+
+        from_addr, to_addrs, flatmsg = connection.sendmail.call_args.args[:3]
+        self.assertEqual(from_addr, "test@test.com")
+        self.assertIn("test2@test.com", to_addrs)
+        self.assertNotIn(b"test2@test.com", flatmsg)
+
+    @patch("emailService.SMTP")
+    def test_send_async(self, smtp) -> None:
+        settings = EmailServiceSettings(
+            username="test@test.com",
+            password="password",
+            server="smtp.test.com",
+            port=587,
+        )
+        email_services = [
+            EmailService(settings).recipients([f"test{i}@test.com"]) for i in range(3)
+        ]
+
+        async def send_all() -> list[bool]:
+            return await asyncio.gather(
+                *[email_service.send_async() for email_service in email_services]
+            )
+
+        self.assertEqual(asyncio.run(send_all()), [True, True, True])
+        self.assertEqual(smtp.call_count, 3)
+
 
 if __name__ == "__main__":
     unittest.main()